@@ -1,8 +1,12 @@
 import streamlit as st
-import pandas as pd
-import base64
+import csv
+import hashlib
+import html
+import json
 import os
-from PIL import Image
+import re
+from operator import itemgetter
+from urllib.parse import quote
 
 # --- PAGE CONFIGURATION ---
 st.set_page_config(
@@ -13,6 +17,14 @@ st.set_page_config(
 
 # --- 🔧 SETTINGS ---
 EMBED_HEIGHT = 680
+# Files in ./static are served by Streamlit (server.enableStaticServing) at
+# this URL, so the browser can fetch and cache them instead of us inlining them.
+STATIC_DIR = "static"
+STATIC_URL = "app/static/"
+POPUP_DIR = os.path.join(STATIC_DIR, "popups")
+PLACEHOLDER_IMG = "https://via.placeholder.com/300x200?text=No+Image"
+# Rendered maps are kept here so a fresh process can skip rebuilding them
+CACHE_DIR = ".cache"
 
 # --- CSS TO REMOVE ALL BRANDING, BUTTONS & FOOTERS ---
 hide_streamlit_style = """
@@ -60,191 +72,350 @@ hide_streamlit_style = """
 st.markdown(hide_streamlit_style, unsafe_allow_html=True)
 
 # --- HELPER FUNCTIONS ---
-def get_base64_of_bin_file(bin_file):
+def get_mtime(path):
     try:
-        with open(bin_file, 'rb') as f:
-            data = f.read()
-        return base64.b64encode(data).decode()
-    except Exception:
+        return os.path.getmtime(path)
+    except OSError:
         return None
 
-def find_popup_image(image_name):
+# Only the JPEG header is parsed, and only when image1.jpg itself changes; a
+# CSV edit reuses the cached size. Pillow is imported here so runs served
+# straight from the disk cache never load it.
+@st.cache_data(show_spinner=False)
+def get_image_size(image_path, version):
+    from PIL import Image
+    with Image.open(image_path) as img:
+        return img.size
+
+POPUP_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+# Columns read from spaces.csv, in the order the generator unpacks them
+SPACE_COLUMNS = ('coordinates', 'link url', 'space', 'type', 'size', 'actual site')
+
+def build_image_index(image_dir):
+    # One directory scan instead of up to three stat calls per CSV row.
+    # Earlier extensions win, matching the old probe order.
+    ranked = {}
+    try:
+        with os.scandir(image_dir) as entries:
+            for entry in entries:
+                stem, ext = os.path.splitext(entry.name)
+                if ext in POPUP_EXTENSIONS and entry.is_file():
+                    rank = POPUP_EXTENSIONS.index(ext)
+                    if stem not in ranked or rank < ranked[stem][0]:
+                        ranked[stem] = (rank, entry.path)
+    except OSError:
+        return {}
+    return {stem: path for stem, (rank, path) in ranked.items()}
+
+def static_url(file_path, version=None):
+    rel_path = os.path.relpath(file_path, STATIC_DIR).replace(os.sep, '/')
+    url = STATIC_URL + quote(rel_path)
+    # The version query busts the browser cache when the file is replaced
+    if version is not None:
+        url += f"?v={version}"
+    return url
+
+def find_popup_image(image_name, image_index):
     if not isinstance(image_name, str):
         return None
-    clean_name = image_name.strip()
-    extensions = ['.jpg', '.jpeg', '.png']
-    for ext in extensions:
-        file_path = f"{clean_name}{ext}"
-        if os.path.exists(file_path):
-            return file_path
-    return None
+    return image_index.get(image_name.strip())
+
+# --- TEMPLATES ---
+# Built once per script run; each polygon only pays for a format_map call.
+# Hover is handled by one delegated listener in MAP_SCRIPT; data-idx points
+# into the SPACES array emitted alongside it.
+# Link set to '_blank' (New Tab)
+POLYGON_TEMPLATE = (
+    '<a href="{link}" target="_blank">'
+    '<polygon class="map-poly" points="{coords}" data-idx="{idx}"></polygon>'
+    '</a>'
+)
+
+def minify(code):
+    # Drop comments and collapse indentation once per script run
+    code = re.sub(r'/\*.*?\*/', '', code, flags=re.S)
+    return re.sub(r'\s+', ' ', code).strip()
+
+MAP_STYLE = minify("""
+    body { margin: 0; padding: 0; background-color: transparent; overflow: hidden; }
+    .map-container { position: relative; width: 100%; max-width: 100%; height: auto; }
+    .map-image { width: 100%; height: auto; display: block; }
+    .map-svg { position: absolute; top: 0; left: 0; width: 100%; height: 100%; }
+
+    /* Interaction Styling */
+    .map-poly {
+        fill: rgba(255, 255, 255, 0.01);
+        stroke: none;
+        cursor: pointer;
+    }
+
+    #tooltip {
+        display: none;
+        position: fixed;
+        left: 0;
+        top: 0;
+        transform: translate3d(-9999px, -9999px, 0);
+        will-change: transform;
+        background: rgba(15, 15, 15, 0.95);
+        color: white;
+        border: 1px solid #555;
+        border-radius: 6px;
+        padding: 12px;
+        font-family: sans-serif;
+        pointer-events: none;
+        z-index: 10000;
+        width: 240px;
+        box-shadow: 0 4px 20px rgba(0,0,0,0.8);
+    }
+    #tooltip img { width: 100%; height: 140px; object-fit: cover; border-radius: 4px; margin-bottom: 8px; background: #333; }
+    #tooltip h4 { margin: 0 0 4px 0; color: #ffbf00; font-size: 16px; font-weight: 600; }
+    #tooltip p { margin: 0; font-size: 13px; color: #ddd; line-height: 1.5; }
+""")
+
+MAP_SCRIPT = minify("""
+    var tooltip = document.getElementById("tooltip");
+    var ttName = document.getElementById("tt-name");
+    var ttDesc = document.getElementById("tt-desc");
+    var ttImg = document.getElementById("tt-img");
+
+    var shownPoly = null;
+
+    function showTooltip(x, y, poly) {
+        /* Content only changes when the cursor enters a different polygon */
+        if (poly !== shownPoly) {
+            shownPoly = poly;
+            var space = SPACES[poly.dataset.idx];
+            tooltip.style.display = "block";
+            ttName.innerHTML = space.t;
+            ttDesc.innerHTML = space.d;
+            if (ttImg.getAttribute("src") !== space.i) { ttImg.src = space.i; }
+        }
+
+        var tooltipW = 260;
+        var tooltipH = 250;
+
+        if (x + tooltipW > window.innerWidth) { x = x - tooltipW; }
+        if (y + tooltipH > window.innerHeight) { y = y - tooltipH; }
+
+        /* Compositor-only move: no layout or paint per mousemove */
+        tooltip.style.transform = "translate3d(" + (x + 15) + "px, " + (y + 15) + "px, 0)";
+    }
+
+    function hideTooltip() {
+        shownPoly = null;
+        tooltip.style.display = "none";
+    }
+
+    /* mousemove can fire well above the display rate; keep only the latest
+       position and apply it at most once per animation frame */
+    var pending = null;
+    var queued = false;
+
+    function applyPending() {
+        queued = false;
+        if (pending.poly) {
+            showTooltip(pending.x, pending.y, pending.poly);
+        } else {
+            hideTooltip();
+        }
+    }
+
+    function queueUpdate(x, y, poly) {
+        pending = { x: x, y: y, poly: poly };
+        if (!queued) {
+            queued = true;
+            requestAnimationFrame(applyPending);
+        }
+    }
+
+    var mapSvg = document.querySelector(".map-svg");
+    mapSvg.addEventListener("mousemove", function (evt) {
+        var target = evt.target;
+        queueUpdate(evt.clientX, evt.clientY, target.classList.contains("map-poly") ? target : null);
+    });
+    mapSvg.addEventListener("mouseleave", function () {
+        queueUpdate(0, 0, null);
+    });
+""")
+
+# Tags are packed together once per script run; dynamic values are filled in
+# with format_map, so the CSS/JS need no brace escaping
+PAGE_TEMPLATE = re.sub(r'>\s+<', '><', """
+<!DOCTYPE html>
+<html>
+<head>
+<style>{map_style}</style>
+</head>
+<body>
+
+<div class="map-container">
+    <img src="{img_src}" class="map-image" width="{svg_width}" height="{svg_height}" loading="eager" decoding="async">
+    <svg viewBox="0 0 {svg_width} {svg_height}" class="map-svg" preserveAspectRatio="none">
+        {polygons_html}
+    </svg>
+</div>
+
+<div id="tooltip">
+    <img id="tt-img" loading="lazy" decoding="async" alt="Space Preview">
+    <h4 id="tt-name"></h4>
+    <p id="tt-desc"></p>
+</div>
+
+<script>var SPACES = {spaces_json};</script>
+<script>{map_script}</script>
+</body>
+</html>
+""").strip()
 
 # --- MAIN GENERATOR ---
-def generate_interactive_map(image_path, csv_path):
+def build_interactive_map(image_path, csv_path, image_index, image_version=None):
     # 1. Load Data
     try:
-        df = pd.read_csv(csv_path)
-        df.columns = df.columns.str.strip().str.lower()
+        with open(csv_path, newline='', encoding='utf-8-sig') as f:
+            reader = csv.reader(f)
+            header = [c.strip().lower() for c in next(reader, [])]
+            # Pick just the used columns out of each row; unused columns never
+            # reach a dict. Missing columns and short rows read as ''.
+            pick = itemgetter(*(header.index(c) if c in header else -1 for c in SPACE_COLUMNS))
+            padding = [''] * (len(header) + 1)
+            rows = [pick(row + padding) for row in reader if row]
     except FileNotFoundError:
         return "<h3 style='color:white; text-align:center'>Error: spaces.csv not found.</h3>"
     except Exception as e:
         return f"<h3 style='color:white; text-align:center'>Error reading CSV: {e}</h3>"
 
-    # 2. Encode Background & Detect Size
-    if os.path.exists(image_path):
-        with Image.open(image_path) as img:
-            img_width, img_height = img.size
-        
-        bg_base64 = get_base64_of_bin_file(image_path)
-        img_src = f"data:image/jpeg;base64,{bg_base64}"
-    else:
+    # 2. Detect Background Size (the image itself is served statically)
+    try:
+        img_width, img_height = get_image_size(image_path, image_version)
+    except FileNotFoundError:
         return "<h3 style='color:white; text-align:center'>Error: Background image1.jpg not found.</h3>"
 
+    img_src = static_url(image_path, image_version)
+
     # 3. Generate SVG Polygons
     svg_width = img_width
     svg_height = img_height
 
-    polygons_html = ""
-    
-    for index, row in df.iterrows():
-        coords = str(row.get('coordinates', ''))
-        raw_link = str(row.get('link url', '#'))
-        
-        if raw_link and not raw_link.startswith(('http://', 'https://')):
-            link = 'https://' + raw_link
-        else:
-            link = raw_link
-
-        title = str(row.get('space', ''))
-        space_type = row.get('type', 'N/A')
-        size_val = row.get('size', 'N/A')
-        
+    # Resolve each distinct site to its popup URL once. Only the URL goes
+    # into the page; the browser fetches the image on hover.
+    popup_srcs = {}
+    for *_, site in rows:
+        if site not in popup_srcs:
+            popup_img_path = find_popup_image(site, image_index)
+            popup_img_src = static_url(popup_img_path) if popup_img_path else PLACEHOLDER_IMG
+            popup_srcs[site] = popup_img_src
+
+    polygon_parts = []
+    spaces = []
+
+    for idx, (coords, link, title, space_type, size_val, site) in enumerate(rows):
+        coords = coords or ''
+        link = link or '#'
+        if not link.startswith(('http://', 'https://', '#')):
+            link = 'https://' + link
+
+        # Tooltip text is shown via innerHTML, so CSV values are escaped
+        # before the intentional <br> is added
+        title = html.escape(title or '')
+        space_type = html.escape(space_type or 'N/A')
+        size_val = html.escape(size_val or 'N/A')
+
         # Format Description: Stacked lines
         desc = f"Type: {space_type}<br>Size: {size_val} sqft"
-        
-        actual_site_name = row.get('actual site', '')
-        popup_img_path = find_popup_image(actual_site_name)
-        
-        if popup_img_path:
-            img_b64 = get_base64_of_bin_file(popup_img_path)
-            popup_img_src = f"data:image/jpeg;base64,{img_b64}"
-        else:
-            popup_img_src = "https://via.placeholder.com/300x200?text=No+Image"
-
-        title = title.replace("'", "&#39;")
-        desc = desc.replace("'", "&#39;")
-        
-        # Link set to '_blank' (New Tab)
-        polygons_html += f"""
-        <a href="{link}" target="_blank" style="text-decoration: none;">
-            <polygon class="map-poly" points="{coords}" 
-                onmousemove="showTooltip(evt, '{title}', '{desc}', '{popup_img_src}')" 
-                onmouseout="hideTooltip()">
-            </polygon>
-        </a>
-        """
+
+        polygon_parts.append(POLYGON_TEMPLATE.format_map({
+            'link': html.escape(link),
+            'coords': html.escape(coords),
+            'idx': idx,
+        }))
+        spaces.append({'t': title, 'd': desc, 'i': popup_srcs[site]})
+
+    polygons_html = "".join(polygon_parts)
+    # Escaping '<' keeps CSV text from closing the <script> it sits in
+    spaces_json = json.dumps(spaces, ensure_ascii=False, separators=(",", ":")).replace("<", "\\u003c")
 
     # 4. Construct Final HTML
-    html_code = f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-    <style>
-        body {{ margin: 0; padding: 0; background-color: transparent; overflow: hidden; }}
-        .map-container {{ position: relative; width: 100%; max-width: 100%; height: auto; }}
-        .map-image {{ width: 100%; height: auto; display: block; }}
-        .map-svg {{ position: absolute; top: 0; left: 0; width: 100%; height: 100%; }}
-        
-        /* Interaction Styling */
-        .map-poly {{ 
-            fill: rgba(255, 255, 255, 0.01); 
-            stroke: none; 
-            cursor: pointer; 
-        }}
-        
-        .map-poly:hover {{ 
-            fill: rgba(255, 255, 255, 0.01);
-            stroke: none;
-        }}
-        
-        #tooltip {{
-            display: none;
-            position: fixed; 
-            background: rgba(15, 15, 15, 0.95);
-            color: white;
-            border: 1px solid #555;
-            border-radius: 6px;
-            padding: 12px;
-            font-family: sans-serif;
-            pointer-events: none;
-            z-index: 10000;
-            width: 240px;
-            box-shadow: 0 4px 20px rgba(0,0,0,0.8);
-        }}
-        #tooltip img {{ width: 100%; height: 140px; object-fit: cover; border-radius: 4px; margin-bottom: 8px; background: #333; }}
-        #tooltip h4 {{ margin: 0 0 4px 0; color: #ffbf00; font-size: 16px; font-weight: 600; }}
-        #tooltip p {{ margin: 0; font-size: 13px; color: #ddd; line-height: 1.5; }}
-    </style>
-    </head>
-    <body>
-
-    <div class="map-container">
-        <img src="{img_src}" class="map-image">
-        <svg viewBox="0 0 {svg_width} {svg_height}" class="map-svg" preserveAspectRatio="none">
-            {polygons_html}
-        </svg>
-    </div>
-
-    <div id="tooltip">
-        <img id="tt-img" src="" alt="Space Preview">
-        <h4 id="tt-name"></h4>
-        <p id="tt-desc"></p>
-    </div>
-
-    <script>
-        var tooltip = document.getElementById("tooltip");
-        var ttName = document.getElementById("tt-name");
-        var ttDesc = document.getElementById("tt-desc");
-        var ttImg = document.getElementById("tt-img");
-
-        function showTooltip(evt, name, desc, imgUrl) {{
-            tooltip.style.display = "block";
-            ttName.innerHTML = name;
-            ttDesc.innerHTML = desc;
-            ttImg.src = imgUrl;
-            
-            var x = evt.clientX;
-            var y = evt.clientY;
-            
-            var tooltipW = 260;
-            var tooltipH = 250;
-            
-            if (x + tooltipW > window.innerWidth) {{ x = x - tooltipW; }}
-            if (y + tooltipH > window.innerHeight) {{ y = y - tooltipH; }}
-
-            tooltip.style.left = (x + 15) + "px";
-            tooltip.style.top = (y + 15) + "px";
-        }}
-
-        function hideTooltip() {{
-            tooltip.style.display = "none";
-        }}
-    </script>
-    </body>
-    </html>
-    """
+    html_code = PAGE_TEMPLATE.format_map({
+        'img_src': html.escape(img_src),
+        'svg_width': svg_width,
+        'svg_height': svg_height,
+        'polygons_html': polygons_html,
+        'spaces_json': spaces_json,
+        'map_style': MAP_STYLE,
+        'map_script': MAP_SCRIPT,
+    })
+    return html_code
+
+# --- CACHING ---
+def file_digest(path):
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.blake2b(f.read(), digest_size=16).hexdigest()
+    except OSError:
+        return None
+
+def disk_cache_path(*key_parts):
+    key = hashlib.blake2b("|".join(map(str, key_parts)).encode()).hexdigest()[:16]
+    return os.path.join(CACHE_DIR, f"map-{key}.html")
+
+def write_disk_cache(cache_path, html_code):
+    # Write-then-rename so a concurrent reader never sees a partial file, and
+    # drop maps rendered from older inputs. A read-only disk just means no cache.
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(html_code)
+        os.replace(tmp_path, cache_path)
+        for entry in os.scandir(CACHE_DIR):
+            if (entry.name.startswith("map-") and entry.name.endswith(".html")
+                    and entry.path != cache_path):
+                os.remove(entry.path)
+    except OSError:
+        pass
+
+# Cached once per process, and on disk across restarts. The mtime arguments
+# only exist to invalidate the process cache when image1.jpg, spaces.csv or the
+# popups folder change. The result is an immutable str, so cache_resource can
+# hand back the same object on every rerun instead of cache_data's pickle
+# round-trip.
+@st.cache_resource(show_spinner=False)
+def generate_interactive_map(image_path, csv_path, image_mtime=None, csv_mtime=None, popups_mtime=None):
+    # The disk key covers everything the HTML depends on by content (this
+    # app's code, the CSV, the background and the popup file names), so a
+    # redeploy that only touches mtimes still hits, while a code change never
+    # serves a map rendered by the old code
+    image_digest = file_digest(image_path)
+    image_index = build_image_index(POPUP_DIR)
+    cache_path = disk_cache_path(
+        file_digest(__file__), file_digest(csv_path), image_digest,
+        sorted(image_index.items()),
+    )
+    try:
+        with open(cache_path, encoding='utf-8') as f:
+            return f.read()
+    except OSError:
+        pass
+
+    html_code = build_interactive_map(
+        image_path, csv_path, image_index, image_digest and image_digest[:12]
+    )
+    write_disk_cache(cache_path, html_code)
     return html_code
 
 # --- APP EXECUTION ---
 current_dir = os.getcwd()
-img_file = os.path.join(current_dir, "image1.jpg")
+img_file = os.path.join(current_dir, STATIC_DIR, "image1.jpg")
 csv_file = os.path.join(current_dir, "spaces.csv")
 
 # --- SPINNER LOGIC ADDED HERE ---
 # This ensures the user sees "Loading..." while the images are processing
 with st.spinner("Loading Map..."):
     # Generate the HTML
-    html_content = generate_interactive_map(img_file, csv_file)
+    html_content = generate_interactive_map(
+        img_file, csv_file,
+        get_mtime(img_file), get_mtime(csv_file), get_mtime(POPUP_DIR),
+    )
 
     # Use manual height + DISABLE SCROLLING
     st.components.v1.html(html_content, height=EMBED_HEIGHT, scrolling=False)